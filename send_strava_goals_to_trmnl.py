@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 import datetime as dt
+import hashlib
 import json
+import mmap
 import os
 import sys
-from typing import Any, Dict, List, Optional, Tuple, TypeAlias, cast
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, TypeAlias, cast
 
 import requests
-import yaml
-from dotenv import load_dotenv
-from stravalib.client import Client
+from requests.adapters import HTTPAdapter, Retry
 
-load_dotenv()
+try:
+    import orjson
+except ImportError:
+    orjson = None  # stdlib json is used when orjson is unavailable
+
+if TYPE_CHECKING:
+    from stravalib.client import Client
 
 if os.environ.get("CI") and os.environ.get("STRAVA_CREDENTIALS"):
     with open(".strava-credentials", "w") as f:
@@ -49,7 +57,8 @@ class Config:
         :raises ConfigError: If required environment variables are missing
         """
         required = ["STRAVA_CLIENT_ID", "STRAVA_CLIENT_SECRET"]
-        missing = [var for var in required if var not in os.environ]
+        values = {var: os.environ.get(var) for var in required}
+        missing = [var for var, value in values.items() if value is None]
 
         if missing:
             raise ConfigError(
@@ -58,30 +67,131 @@ class Config:
             )
 
         return cls(
-            client_id=os.environ["STRAVA_CLIENT_ID"],
-            client_secret=os.environ["STRAVA_CLIENT_SECRET"],
+            client_id=cast(str, values["STRAVA_CLIENT_ID"]),
+            client_secret=cast(str, values["STRAVA_CLIENT_SECRET"]),
         )
 
 
 # Define a type alias for the token dictionary
 TokenDict: TypeAlias = Dict[str, Any]
 
+# Last parsed token keyed by the credentials file's st_mtime_ns, so
+# rapid re-invocations skip re-parsing an unchanged credentials file.
+_TOKEN_CACHE: Dict[int, TokenDict] = {}
+
+# Parsed goals keyed by the goals.yml modification time, so repeated
+# invocations skip the YAML parse when the file hasn't changed.
+_GOALS_CACHE: Dict[float, Tuple[float, float]] = {}
+
+
+def _make_session() -> requests.Session:
+    """Creates a pooled session with retries for all outgoing HTTP calls."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=4,
+        max_retries=Retry(
+            total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504]
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared session so token refresh and the TRMNL POST reuse pooled connections.
+_HTTP = _make_session()
+
+
+# Digest of the variables sent on the previous run, used to skip noop POSTs.
+_LAST_HASH_FILE = ".trmnl-last-hash"
+
+_TRMNL_URL_TEMPLATE = "https://usetrmnl.com/api/custom_plugins/{}"
+
+# TRMNL plugin UUID, validated once per process on first use.
+_TRMNL_PLUGIN_UUID: Optional[str] = None
+
+
+def _trmnl_plugin_uuid() -> str:
+    """Returns the TRMNL plugin UUID, validating it once per process.
+
+    :raises ConfigError: If TRMNL_PLUGIN_UUID is not set
+    """
+    global _TRMNL_PLUGIN_UUID
+    if _TRMNL_PLUGIN_UUID is None:
+        uuid = os.environ.get("TRMNL_PLUGIN_UUID")
+        if not uuid:
+            raise ConfigError(
+                "Missing required environment variable: TRMNL_PLUGIN_UUID\n"
+                "Please set in .env: TRMNL_PLUGIN_UUID"
+            )
+        _TRMNL_PLUGIN_UUID = uuid
+    return _TRMNL_PLUGIN_UUID
+
+
+def send_batch(payloads: List[Tuple[str, Dict[str, Any]]]) -> List[requests.Response]:
+    """POSTs each (plugin UUID, variables) payload to TRMNL.
+
+    The shared pooled session keeps the TLS connection alive across
+    POSTs, so updating several plugins reuses one handshake.
+    """
+    return [
+        _HTTP.post(_TRMNL_URL_TEMPLATE.format(uuid), json=variables)
+        for uuid, variables in payloads
+    ]
+
+
+def _payload_digest(variables: Dict[str, Any]) -> str:
+    """Returns a short stable digest of the TRMNL payload."""
+    payload = json.dumps(variables, sort_keys=True).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _payload_unchanged(digest: str) -> bool:
+    """Checks whether the same payload was already sent on the last run."""
+    try:
+        with open(_LAST_HASH_FILE, "r") as f:
+            return f.read().strip() == digest
+    except OSError:
+        return False
+
+
+def _remember_payload(digest: str) -> None:
+    """Records the digest of the payload that was just sent."""
+    try:
+        with open(_LAST_HASH_FILE, "w") as f:
+            f.write(digest)
+    except OSError:
+        pass
+
+
+def _load_env() -> None:
+    """Loads .env into the environment, importing dotenv lazily."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
 
 class TokenManager:
     def __init__(self, config: Config):
         self.config = config
+        self._http = _HTTP
 
     def get_valid_token(self) -> TokenDict:
         """Returns a valid access token, performing auth flow if needed."""
-        if not os.path.exists(self.config.credentials_file):
+        try:
+            token: Optional[TokenDict] = self._load_token()
+        except AuthError:
+            token = None
+
+        if token is None:
             token = self._perform_oauth_flow()
-            self._save_token(token)
+        elif self._needs_refresh(token):
+            token = self._refresh_token(token["refresh_token"])
+        else:
             return token
 
-        token = self._load_token()
-        if self._needs_refresh(token):
-            token = self._refresh_token(token["refresh_token"])
-            self._save_token(token)
+        self._save_token(token)
         return token
 
     def _perform_oauth_flow(self) -> TokenDict:
@@ -92,6 +202,8 @@ class TokenManager:
             )
 
         # Original OAuth flow for local development
+        from stravalib.client import Client
+
         client = Client()
         auth_url = client.authorization_url(
             client_id=int(self.config.client_id),
@@ -112,16 +224,21 @@ class TokenManager:
         return cast(TokenDict, token)
 
     def _needs_refresh(self, token: TokenDict) -> bool:
-        """Checks if the token needs refreshing based on file modification time."""
+        """Checks if the token is expired or about to expire."""
+        expires_at = token.get("expires_at")
+        if expires_at is not None:
+            # Refresh 5 minutes before Strava's reported expiry.
+            return time.time() > float(expires_at) - 300
+
+        # Tokens without expires_at fall back to the file-age heuristic.
         hours_since_refresh = (
-            dt.datetime.now().timestamp()
-            - os.path.getmtime(self.config.credentials_file)
+            time.time() - os.path.getmtime(self.config.credentials_file)
         ) / 3600.0
         return hours_since_refresh > self.config.token_refresh_hours
 
     def _refresh_token(self, refresh_token: str) -> TokenDict:
         """Refreshes an expired access token."""
-        response = requests.post(
+        response = self._http.post(
             "https://www.strava.com/api/v3/oauth/token",
             data={
                 "client_id": self.config.client_id,
@@ -136,15 +253,32 @@ class TokenManager:
 
     def _save_token(self, token: TokenDict) -> None:
         """Saves token data to disk."""
-        with open(self.config.credentials_file, "w") as f:
-            json.dump(token, f)
+        if orjson is not None:
+            with open(self.config.credentials_file, "wb") as f:
+                f.write(orjson.dumps(token))
+        else:
+            with open(self.config.credentials_file, "w") as f:
+                json.dump(token, f)
 
     def _load_token(self) -> TokenDict:
-        """Loads token data from disk."""
+        """Loads token data from disk, caching on the file's mtime."""
         try:
-            with open(self.config.credentials_file, "r") as f:
-                return json.load(f)
-        except (IOError, json.JSONDecodeError) as e:
+            mtime_ns = os.stat(self.config.credentials_file).st_mtime_ns
+            if mtime_ns in _TOKEN_CACHE:
+                return _TOKEN_CACHE[mtime_ns]
+
+            with open(self.config.credentials_file, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    data = bytes(mm)
+            if orjson is not None:
+                token = cast(TokenDict, orjson.loads(data))
+            else:
+                token = cast(TokenDict, json.loads(data))
+
+            _TOKEN_CACHE.clear()
+            _TOKEN_CACHE[mtime_ns] = token
+            return token
+        except (IOError, ValueError) as e:
             raise AuthError(f"Failed to load credentials: {e}")
 
 
@@ -152,12 +286,15 @@ class Strava:
     def __init__(self, config: Config):
         self.config = config
         self.token_manager = TokenManager(config)
-        self._client: Optional[Client] = None
+        self._client: Optional["Client"] = None
+        self._goals: Optional[Tuple[float, float]] = None
 
     @property
-    def client(self) -> Client:
+    def client(self) -> "Client":
         """Lazy-loaded Strava client instance."""
         if self._client is None:
+            from stravalib.client import Client
+
             token = self.token_manager.get_valid_token()
             self._client = Client(access_token=str(token["access_token"]))
             assert self._client is not None
@@ -165,42 +302,120 @@ class Strava:
 
     def get_summary(self) -> Dict[str, Any]:
         """Structures summary of running activity for TRMNL."""
-        stats = self.client.get_athlete_stats()
-        ytd_distance = self._get_ytd_distance(stats)
-        runs = self._get_weekly_runs()
+        # Resolve the client (and any token refresh) once before fanning out.
+        client = self.client
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            stats_future = executor.submit(client.get_athlete_stats)
+            distance_future = executor.submit(self._get_weekly_distance)
+            stats = stats_future.result()
+            week_distance = distance_future.result()
 
-        if not runs:
-            return self._structure_summary(0, ytd_distance)
-
-        week_distance = self._calculate_weekly_distance(runs)
+        ytd_distance = self._get_ytd_distance(stats)
         return self._structure_summary(week_distance, ytd_distance)
 
     def _get_ytd_distance(self, stats: Any) -> float:
         """Extracts year-to-date running distance in kilometers."""
-        ytd = getattr(stats, "ytd_run_totals", None)
-        return (float(ytd.distance) / 1000.0) if ytd else 0
+        ytd = stats.ytd_run_totals
+        return (ytd.distance / 1000.0) if ytd else 0.0
+
+    def _get_weekly_distance(self) -> float:
+        """Sums this week's running distance in kilometers in one pass."""
+        today = dt.date.today()
+        week_start = dt.datetime.combine(
+            today - dt.timedelta(days=today.weekday()),
+            dt.time.min,
+            tzinfo=dt.timezone.utc,
+        )
+
+        distances: List[float] = []
+        for act in self.client.get_activities(after=week_start):
+            # Defensive: stop paginating once activities fall outside the
+            # week window, even if the server mishandles the after filter.
+            if act.start_date is not None and act.start_date < week_start:
+                break
+            if act.type == "Run":
+                distances.append(float(act.distance))
+        return self._sum_distances(distances) / 1000.0
+
+    @staticmethod
+    def _sum_distances(distances: List[float]) -> float:
+        """Sums distances in meters, vectorizing with numpy for long lists."""
+        # Below this size the numpy import costs more than it saves.
+        if len(distances) > 32:
+            try:
+                import numpy as np
+            except ImportError:
+                pass
+            else:
+                return float(np.asarray(distances, dtype=np.float64).sum())
+        return sum(distances)
 
-    def _get_weekly_runs(self) -> List[Any]:
-        """Fetches this week's running activities."""
-        today = dt.datetime.now()
-        week_start = today - dt.timedelta(days=today.weekday())
-        week_start = week_start.replace(hour=0, minute=0, second=0, microsecond=0)
+    def _load_goals(self) -> Tuple[float, float]:
+        """Returns running goals, reading them at most once per instance."""
+        if self._goals is None:
+            self._goals = self._read_goals()
+        return self._goals
 
-        activities = self.client.get_activities(after=week_start)
-        return [act for act in activities if act.type == "Run"]
+    def _read_goals(self) -> Tuple[float, float]:
+        """Reads running goals from goals.yml, via a goals.json cache."""
+        try:
+            mtime = os.path.getmtime("goals.yml")
+        except OSError:
+            return 0, 0
 
-    def _calculate_weekly_distance(self, runs: List[Any]) -> float:
-        """Calculates total distance for provided runs in kilometers."""
-        return sum(float(run.distance) for run in runs) / 1000.0
+        if mtime in _GOALS_CACHE:
+            return _GOALS_CACHE[mtime]
+
+        goals = self._read_cached_goals(mtime)
+        if goals is None:
+            goals = self._parse_goals_yaml()
+            if goals is None:
+                return 0, 0
+            self._write_cached_goals(goals)
+
+        parsed = float(goals.get("weekly", 0)), float(goals.get("yearly", 1000))
+        _GOALS_CACHE[mtime] = parsed
+        return parsed
+
+    def _parse_goals_yaml(self) -> Optional[Dict[str, Any]]:
+        """Parses goals.yml, importing yaml only when a parse is needed."""
+        import yaml
+
+        try:
+            from yaml import CSafeLoader as loader
+        except ImportError:
+            from yaml import SafeLoader as loader
+
+            print(
+                "libyaml bindings not available, "
+                "falling back to pure-Python YAML loader",
+                file=sys.stderr,
+            )
 
-    def _load_goals(self) -> Tuple[float, float]:
-        """Loads running goals from goals.yml file."""
         try:
             with open("goals.yml", "r") as f:
-                goals = yaml.safe_load(f)
-                return float(goals.get("weekly", 0)), float(goals.get("yearly", 1000))
+                return yaml.load(f, Loader=loader)
         except (IOError, yaml.YAMLError):
-            return 0, 0
+            return None
+
+    def _read_cached_goals(self, yml_mtime: float) -> Optional[Dict[str, Any]]:
+        """Returns goals from goals.json if it is at least as new as goals.yml."""
+        try:
+            if os.path.getmtime("goals.json") < yml_mtime:
+                return None
+            with open("goals.json", "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_cached_goals(self, goals: Dict[str, Any]) -> None:
+        """Writes the parsed goals to goals.json for faster cold starts."""
+        try:
+            with open("goals.json.tmp", "w") as f:
+                json.dump(goals, f)
+            os.replace("goals.json.tmp", "goals.json")
+        except OSError:
+            pass
 
     def _structure_summary(
         self, week_distance: float, ytd_distance: float
@@ -221,14 +436,21 @@ class Strava:
 
 def send_strava_goals_to_trmnl() -> None:
     try:
+        _load_env()
         config = Config.from_environment()
+        plugin_uuid = _trmnl_plugin_uuid()
         strava = Strava(config)
         variables = strava.get_summary()
-        url = (
-            f"https://usetrmnl.com/api/custom_plugins/{os.environ["TRMNL_PLUGIN_UUID"]}"
-        )
-        response = requests.post(url, json=variables)
+
+        digest = _payload_digest(variables)
+        if _payload_unchanged(digest):
+            print("Payload unchanged since last run, skipping TRMNL update")
+            return
+
+        (response,) = send_batch([(plugin_uuid, variables)])
         print(response.json())
+        if response.ok:
+            _remember_payload(digest)
     except StravaError as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)